@@ -1,45 +1,90 @@
 #! /usr/bin/env python3
 
 from argparse import ArgumentParser
-from datetime import date, datetime
-from json import loads
-from os import getenv, path
-from re import sub
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from mmap import mmap, ACCESS_READ
+from os import fstat, getenv, path
+from stat import S_ISREG
+from typing import Optional
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads  # type: ignore
 
 from .report import (
     Mode,
     Typo,
     Stat,
-    hitmap,
-    training_time,
-    common_typos,
-    typo_record,
-    cps_progress,
+    HitmapAccumulator,
+    TrainingTimeAccumulator,
+    TypoRecordAccumulator,
+    CommonTyposAccumulator,
+    CpsProgressAccumulator,
 )
 
 
+@lru_cache(maxsize=None)
+def _to_timezone(offset: str) -> timezone:
+    delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+    return timezone(-delta if offset[0] == "-" else delta)
+
+
 def _to_datetime(iso: str) -> datetime:
-    parsable = sub(r"([\d\-T:]{19}\.\d{6})\d*([+\-]\d{2}):(\d{2})", "\\1|\\2\\3", iso)
+    # gotypist always writes YYYY-MM-DDTHH:MM:SS.fffffffff±HH:MM, so fields
+    # can be sliced at fixed offsets; subsecond digits past 6 are dropped
+    dot = iso.rfind(".")
+    sign = max(iso.rfind("+", dot), iso.rfind("-", dot))
+
+    return datetime(
+        int(iso[0:4]),
+        int(iso[5:7]),
+        int(iso[8:10]),
+        int(iso[11:13]),
+        int(iso[14:16]),
+        int(iso[17:19]),
+        int(iso[dot + 1 : dot + 7]),
+        _to_timezone(iso[sign:]),
+    )
+
 
-    return datetime.strptime(parsable, "%Y-%m-%dT%H:%M:%S.%f|%z")
+def _read_lines(stats_file):
+    with open(stats_file, "rb") as f:
+        st = fstat(f.fileno())
+        if not S_ISREG(st.st_mode) or st.st_size == 0:
+            # pipes and empty files cannot be mapped
+            yield from f
+            return
+        with mmap(f.fileno(), 0, access=ACCESS_READ) as mm:
+            yield from iter(mm.readline, b"")
 
 
-def read_stats(stats_file):
-    with open(stats_file) as f:
-        for line in f:
-            stat = loads(line)
-            if stat.get("version", 0) != 1:
-                continue
+def read_stats(stats_file, min_date: Optional[date] = None):
+    """
+    Yield the stats recorded in stats_file. When min_date is given, sessions
+    started before that day are skipped before their other fields get parsed
+    """
+    for line in _read_lines(stats_file):
+        stat = loads(line)
+        if stat.get("version", 0) != 1:
+            continue
 
-            stat.update(
-                {
-                    "started_at": _to_datetime(stat["started_at"]),
-                    "finished_at": _to_datetime(stat["finished_at"]),
-                    "mode": Mode(stat["mode"] + 1),
-                    "typos": [Typo(**t) for t in stat["typos"]],
-                }
-            )
-            yield Stat(**stat)
+        started_at = _to_datetime(stat["started_at"])
+        started_date = started_at.date()
+        if min_date is not None and started_date < min_date:
+            continue
+
+        stat.update(
+            {
+                "started_at": started_at,
+                "started_date": started_date,
+                "finished_at": _to_datetime(stat["finished_at"]),
+                "mode": Mode(stat["mode"] + 1),
+                "typos": [Typo(t["expected"], t["actual"]) for t in stat["typos"]],
+            }
+        )
+        yield Stat(**stat)
 
 
 def main():
@@ -49,20 +94,33 @@ def main():
         default=path.join(getenv("HOME", ""), ".gotypist.stats"),
         help="Stats file generated by gotypist. Default $HOME/.gotypist.stats",
     )
+    parser.add_argument(
+        "--hitmap-only",
+        action="store_true",
+        help="Only show the 6 months hitmap, skipping older sessions while parsing",
+    )
     parser.add_argument("--version", action="version", version="1.1.4")
 
     args = parser.parse_args()
 
-    today = date.today()
-    stats = list(read_stats(args.stats_file))
+    hitmap = HitmapAccumulator(date.today())
+    accumulators = [
+        hitmap,
+        TrainingTimeAccumulator(),
+        TypoRecordAccumulator(),
+        CommonTyposAccumulator(),
+        CpsProgressAccumulator(),
+    ]
+    min_date = None
+
+    if args.hitmap_only:
+        accumulators, min_date = [hitmap], hitmap.begin
+
+    for stat in read_stats(args.stats_file, min_date=min_date):
+        for accumulator in accumulators:
+            accumulator.update(stat)
 
-    for report in [
-        hitmap(today, stats),
-        training_time(stats),
-        typo_record(stats),
-        common_typos(stats),
-        cps_progress(stats),
-    ]:
+    for report in (accumulator.finalize() for accumulator in accumulators):
         print(f"\n🟄 {report.title} 🟄\n")
         print(report.content)
 
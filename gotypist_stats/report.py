@@ -1,10 +1,10 @@
+from abc import ABC, abstractmethod
+from array import array
 from datetime import date, datetime, timedelta
 from calendar import day_abbr
-from collections import defaultdict
+from collections import Counter, defaultdict
 from enum import Enum
-from functools import reduce
-from typing import NamedTuple, List, Sequence as Seq, Dict, Tuple
-from statistics import median
+from typing import Any, NamedTuple, List, Iterable, Dict, Optional, cast
 
 import tabulate as tb
 from tabulate import tabulate
@@ -15,6 +15,9 @@ from .helper import quantiles_38
 
 Mode = Enum("Mode", "FAST SLOW NORMAL")
 
+# hitmap cells for no session, some sessions, at least the median of sessions
+_CHARS = ("░░", "▒▒", "▓▓")
+
 
 class Typo(NamedTuple):
     expected: str
@@ -32,6 +35,7 @@ class Stat(NamedTuple):
     cps: float
     wpm: float
     version: int
+    started_date: Optional[date] = None  # filled by read_stats to save .date() calls
 
 
 class Report(NamedTuple):
@@ -50,153 +54,233 @@ def _human_duration(delta: timedelta) -> str:
 
 
 def _box_plot(start: int, q25: int, med: int, q75: int, end: int) -> str:
-    conditions = (
-        (lambda i: i < start, " "),
-        (lambda i: i == med, "▣"),
-        (lambda i: i == start, "├"),
-        (lambda i: i == end, "┤"),
-        (lambda i: i >= q25 and i < med, "□"),
-        (lambda i: i > med and i <= q75, "□"),
-        (lambda i: i > start and i < q25, "─"),
-        (lambda i: i > q75 and i < end, "─"),
-    )
-
-    plot = ""
-    for i in range(end + 1):
-        for cond, char in conditions:
-            if cond(i):
-                plot += char
-                break
-
-    return plot
-
-
-def hitmap(today: date, stats: Seq[Stat]) -> Report:
-    begin = today - timedelta(days=182)
-    first_monday = begin - timedelta(begin.weekday())
-    last_monday = today - timedelta(today.weekday())
-    nb_weeks = 1 + (last_monday - first_monday).days // 7
-
-    hitmap: Dict[date, int] = defaultdict(int)
+    # quartiles are extrapolated for tiny samples and may fall outside the
+    # whiskers, so every range is clamped to start..end
+    plot = [" "] * (end + 1)
+    for i in range(start + 1, min(q25, end)):
+        plot[i] = "─"
+    for i in range(max(q75 + 1, start + 1), end):
+        plot[i] = "─"
+    for i in range(max(q25, start + 1), med):
+        plot[i] = "□"
+    for i in range(med + 1, min(q75, end - 1) + 1):
+        plot[i] = "□"
+    plot[start] = "├"
+    plot[end] = "┤"
+    plot[med] = "▣"
+
+    return "".join(plot)
+
+
+class Accumulator(ABC):
+    """
+    Incremental report builder: fed one stat at a time so that all reports
+    can be computed in a single pass over the stats file
+    """
+
+    @abstractmethod
+    def update(self, stat: Stat) -> None: ...
+
+    @abstractmethod
+    def finalize(self) -> Report: ...
+
+
+class HitmapAccumulator(Accumulator):
+    def __init__(self, today: date) -> None:
+        self.today = today
+        self.begin = today - timedelta(days=182)
+        self.hitmap: Dict[date, int] = defaultdict(int)
+
+    def update(self, stat: Stat) -> None:
+        day = stat.started_date or stat.started_at.date()
+        if day < self.begin:
+            return
+        self.hitmap[day] += 1
+
+    def finalize(self) -> Report:
+        today, begin, hitmap = self.today, self.begin, self.hitmap
+        first_monday = begin - timedelta(begin.weekday())
+        last_monday = today - timedelta(today.weekday())
+        nb_weeks = 1 + (last_monday - first_monday).days // 7
+
+        counts_by_day = sorted(hitmap.values())
+        mid = len(counts_by_day) // 2
+        if not counts_by_day:
+            med: float = 1  # no session in the period, every cell stays empty
+        elif len(counts_by_day) % 2:
+            med = counts_by_day[mid]
+        else:
+            med = (counts_by_day[mid - 1] + counts_by_day[mid]) / 2
+
+        # counts[7 * week + weekday], so counts[weekday::7] is one line
+        counts = [
+            hitmap.get(first_monday + timedelta(days=i), 0) for i in range(7 * nb_weeks)
+        ]
+
+        lines = []
+        for weekday in range(7):
+            line = "".join(_CHARS[(v > 0) + (v >= med)] for v in counts[weekday::7])
+            lines.append(f"{day_abbr[weekday]} {line}")
+
+        return Report(title="6 months hitmap", content="\n".join(lines))
+
+
+class TrainingTimeAccumulator(Accumulator):
+    def __init__(self) -> None:
+        self.duration = timedelta()
+
+    def update(self, stat: Stat) -> None:
+        self.duration += stat.finished_at - stat.started_at
+
+    def finalize(self) -> Report:
+        return Report(
+            title="Overall stats",
+            content=tabulate(
+                [("Total training time:", _human_duration(self.duration))],
+                tablefmt="grid",
+            ),
+        )
 
-    for stat in stats:
-        if stat.started_at.date() < begin:
-            continue
-        hitmap[stat.started_at.date()] += 1
-
-    med = median(hitmap.values())
-    session_count = lambda week, day: hitmap[
-        first_monday + timedelta(days=7 * week + day)
-    ]
-    char = lambda treshold, v: "▓▓" if v >= treshold else "▒▒" if v > 0 else "░░"
-
-    lines = []
-    for weekday in range(7):
-        line = "".join(
-            char(med, session_count(week, weekday)) for week in range(nb_weeks)
+
+class TypoRecordAccumulator(Accumulator):
+    def __init__(self) -> None:
+        self.worse: Optional[Stat] = None
+
+    def update(self, stat: Stat) -> None:
+        if self.worse is None or stat.errors > self.worse.errors:
+            self.worse = stat
+
+    def finalize(self) -> Report:
+        worse = cast(Stat, self.worse)
+        return Report(
+            title="Biggest failure",
+            content=tabulate(
+                (
+                    ("was typing", worse.text),
+                    ("mode", worse.mode.name.lower()),
+                    ("failed", f"{worse.errors} times"),
+                    ("happened on", worse.started_at.strftime("%b %m %Y")),
+                    (
+                        "struggled for",
+                        _human_duration(worse.finished_at - worse.started_at),
+                    ),
+                ),
+                tablefmt="grid",
+            ),
         )
-        lines.append(f"{day_abbr[weekday]} {line}")
 
-    return Report(title="6 months hitmap", content="\n".join(lines))
 
+class CommonTyposAccumulator(Accumulator):
+    def __init__(self) -> None:
+        self.typos: "Counter[Typo]" = Counter()
+        self.total = 0
 
-def training_time(stats: Seq[Stat]) -> Report:
-    duration = reduce(
-        lambda total, diff: total + diff,
-        [s.finished_at - s.started_at for s in stats],
-        timedelta(),
-    )
+    def update(self, stat: Stat) -> None:
+        if stat.errors > 0:
+            self.typos.update(stat.typos)
+            self.total += len(stat.typos)
 
-    return Report(
-        title="Overall stats",
-        content=tabulate(
-            [("Total training time:", _human_duration(duration))], tablefmt="grid"
-        ),
-    )
+    def finalize(self) -> Report:
+        values = [
+            (
+                f"{spec.actual} instead of {spec.expected}",
+                count,
+                f"{count / self.total:.2%}",
+            )
+            for (spec, count) in self.typos.most_common(6)
+        ]
+
+        return Report(
+            title="Most common typos",
+            content=tabulate(  # type: ignore
+                values,
+                headers=("Typo", "Mistakes", "% of mistakes"),
+                tablefmt="simple",
+                # default value confuses type checker
+                showindex=range(1, len(values) + 1),
+            ),
+        )
 
 
-def typo_record(stats: Seq[Stat]) -> Report:
-    worse = sorted(stats, key=lambda s: s.errors, reverse=True)[0]
-    return Report(
-        title="Biggest failure",
-        content=tabulate(
+class CpsProgressAccumulator(Accumulator):
+    def __init__(self) -> None:
+        # keyed by months since year 0, i.e. year * 12 + month - 1
+        self.monthly_cps: Dict[int, "array[float]"] = defaultdict(lambda: array("d"))
+        self.month = -1
+        self.cps: "array[float]" = array("d")
+
+    def update(self, stat: Stat) -> None:
+        if stat.mode != Mode.SLOW:
+            return
+        # sessions are logged chronologically, so the month rarely changes
+        month = stat.started_at.year * 12 + stat.started_at.month - 1
+        if month != self.month:
+            self.month, self.cps = month, self.monthly_cps[month]
+        self.cps.append(stat.cps)
+
+    def finalize(self) -> Report:
+        # sorted once so min and max are the ends, and quantiles_38 re-sorts in O(n)
+        sorted_cps = (
+            (key, sorted(cps))
+            for (key, cps) in self.monthly_cps.items()
+            if len(cps) >= 2
+        )
+        plot_input: List[Dict[str, Any]] = [
+            {
+                "year": month // 12,
+                "month": month % 12 + 1,
+                "points": [cps[0], *quantiles_38(cps, n=4), cps[-1]],
+                "count": len(cps),
+            }
+            for (month, cps) in sorted_cps
+        ]
+
+        global_max = max((v["points"][-1] for v in plot_input), default=0)
+        screen_width = 30
+        scale = lambda min, max, width, value: width * float(value) / abs(max - min)
+        screen_pos = lambda value: int(scale(0, global_max, screen_width, value))
+
+        data = [
             (
-                ("was typing", worse.text),
-                ("mode", worse.mode.name.lower()),
-                ("failed", f"{worse.errors} times"),
-                ("happened on", worse.started_at.strftime("%b %m %Y")),
-                (
-                    "struggled for",
-                    _human_duration(worse.finished_at - worse.started_at),
-                ),
+                f"{datetime(input['year'], input['month'], 1).strftime('%b %Y')}",
+                f"{input['points'][2]:.2}",
+                _box_plot(*map(screen_pos, input["points"])),
+                input["count"],
+            )
+            for input in plot_input
+        ]
+
+        return Report(
+            "Characters per second (slow mode)",
+            tabulate(
+                data,
+                headers=("Month", "Median cps", "Plot", "Sessions"),
+                tablefmt="simple",
             ),
-            tablefmt="grid",
-        ),
-    )
+        )
 
 
-def common_typos(stats: Seq[Stat]) -> Report:
-    typos: Dict[Typo, int] = defaultdict(int)
-    total = 0
+def _run(accumulator: Accumulator, stats: Iterable[Stat]) -> Report:
     for stat in stats:
-        if stat.errors > 0:
-            for typo in stat.typos:
-                typos[typo] += 1
-            total += len(stat.typos)
-
-    sorted_typos = sorted(typos.items(), key=lambda i: i[1], reverse=True)
-
-    values = [
-        (f"{spec.actual} instead of {spec.expected}", count, f"{count / total:.2%}")
-        for (spec, count) in sorted_typos[:6]
-    ]
-
-    return Report(
-        title="Most common typos",
-        content=tabulate(  # type: ignore
-            values,
-            headers=("Typo", "Mistakes", "% of mistakes"),
-            tablefmt="simple",
-            showindex=range(1, len(values) + 1),  # default value confuses type checker
-        ),
-    )
-
-
-def cps_progress(stats: Seq[Stat]) -> Report:
-    monthly_cps: Dict[Tuple, List[float]] = defaultdict(list)
-    for s in stats:
-        if s.mode == Mode.SLOW:
-            monthly_cps[(s.started_at.year, s.started_at.month)].append(s.cps)
-
-    plot_input = [
-        {
-            "year": year,
-            "month": month,
-            "points": [min(cps), *quantiles_38(cps, n=4), max(cps)],
-            "count": len(cps),
-        }
-        for ((year, month), cps) in monthly_cps.items()
-        if len(cps) >= 2
-    ]
-
-    global_max = max((v["points"][-1] for v in plot_input), default=0)
-    screen_width = 30
-    scale = lambda min, max, width, value: width * float(value) / abs(max - min)
-    screen_pos = lambda value: int(scale(0, global_max, screen_width, value))
-
-    data = [
-        (
-            f"{datetime(input['year'], input['month'], 1).strftime('%b %Y')}",
-            f"{input['points'][2]:.2}",
-            _box_plot(*map(screen_pos, input["points"])),
-            input["count"],
-        )
-        for input in plot_input
-    ]
-
-    return Report(
-        "Characters per second (slow mode)",
-        tabulate(
-            data, headers=("Month", "Median cps", "Plot", "Sessions"), tablefmt="simple"
-        ),
-    )
+        accumulator.update(stat)
+    return accumulator.finalize()
+
+
+def hitmap(today: date, stats: Iterable[Stat]) -> Report:
+    return _run(HitmapAccumulator(today), stats)
+
+
+def training_time(stats: Iterable[Stat]) -> Report:
+    return _run(TrainingTimeAccumulator(), stats)
+
+
+def typo_record(stats: Iterable[Stat]) -> Report:
+    return _run(TypoRecordAccumulator(), stats)
+
+
+def common_typos(stats: Iterable[Stat]) -> Report:
+    return _run(CommonTyposAccumulator(), stats)
+
+
+def cps_progress(stats: Iterable[Stat]) -> Report:
+    return _run(CpsProgressAccumulator(), stats)
@@ -8,7 +8,7 @@ setup(
     packages=["gotypist_stats"],
     entry_points={"console_scripts": ["gotypist-stats = gotypist_stats.__main__:main"]},
     install_requires=["tabulate"],
-    extras_require={"dev": ["mypy", "pyflakes", "black"]},
+    extras_require={"dev": ["mypy", "pyflakes", "black"], "fast": ["orjson"]},
     license="MIT",
     author="Simon Alfassa",
     author_email="simon@sa-web.fr",